@@ -3,15 +3,344 @@
 Camola - GPU-accelerated webcam background replacement
 Pure Python implementation for maximum performance
 """
+import os
 import sys
 import time
+import queue
 import argparse
+import threading
 import numpy as np
 import cv2
 import onnxruntime as ort
+from onnxruntime.capi.onnxruntime_pybind11_state import Fail as OrtFail
 from PIL import Image
 import fcntl
-from collections import deque
+import ctypes
+
+# Segmentation model input resolution (square)
+MODEL_INPUT_SIZE = 320
+
+# INT8 calibration: frames captured on first use, and the minimum matte IoU against the
+# original model for the quantized model to be accepted
+CALIBRATION_FRAMES = 200
+INT8_MIN_IOU = 0.9
+
+# v4l2 output format, laid out as in <linux/videodev2.h>
+V4L2_BUF_TYPE_VIDEO_OUTPUT = 2
+V4L2_PIX_FMT_YUYV = 0x56595559  # YUYV 4:2:2 format (standard webcam format)
+
+class v4l2_pix_format(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_uint32) for name in (
+        'width', 'height', 'pixelformat', 'field', 'bytesperline', 'sizeimage',
+        'colorspace', 'priv', 'flags', 'ycbcr_enc', 'quantization', 'xfer_func')]
+
+class v4l2_format_fmt(ctypes.Union):
+    # The kernel union also holds structs with pointers, which sets its alignment
+    _fields_ = [('pix', v4l2_pix_format), ('raw_data', ctypes.c_uint8 * 200), ('_align', ctypes.c_void_p)]
+
+class v4l2_format(ctypes.Structure):
+    _fields_ = [('type', ctypes.c_uint32), ('fmt', v4l2_format_fmt)]
+
+# _IOWR('V', 5, struct v4l2_format), so the size matches this platform's struct layout
+VIDIOC_S_FMT = (3 << 30) | (ctypes.sizeof(v4l2_format) << 16) | (ord('V') << 8) | 5
+
+# Numba is optional; without it compositing falls back to NumPy arithmetic
+try:
+    import numba
+    from numba import njit, prange
+    # Kernels are called from pipeline worker threads; the TBB layer can hang at interpreter
+    # exit when driven from a non-main thread, so prefer OpenMP
+    numba.config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# OpenCV CUDA modules are only usable when OpenCV was built with CUDA and a device is present
+try:
+    HAS_CV2_CUDA = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    HAS_CV2_CUDA = False
+
+# CuPy is optional; with it the GPU composite and YUYV packing run as one fused kernel
+try:
+    import cupy as cp
+    HAS_CUPY = True
+except ImportError:
+    HAS_CUPY = False
+
+# Fused GPU composite: bilinear matte upsample (as cv2.resize INTER_LINEAR), alpha blend and
+# BGR -> limited-range BT.601 YUYV (as COLOR_BGR2YUV_YUY2, chroma averaged per pixel pair)
+COMPOSITE_YUYV_SOURCE = r"""
+extern "C" __global__
+void composite_yuyv(const unsigned char* fg, long long fg_step,
+                    const unsigned char* bg, long long bg_step,
+                    const float* matte, long long matte_step, int matte_w, int matte_h,
+                    float opacity, unsigned char* out, long long out_step, int width, int height)
+{
+    // One thread per horizontal pixel pair, which shares a U/V sample in YUYV
+    int pair = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (2 * pair >= width || y >= height) return;
+
+    float sy = fminf(fmaxf((y + 0.5f) * matte_h / height - 0.5f, 0.0f), matte_h - 1.0f);
+    int y0 = (int)sy;
+    int y1 = min(y0 + 1, matte_h - 1);
+    float fy = sy - y0;
+    const float* row0 = (const float*)((const char*)matte + y0 * matte_step);
+    const float* row1 = (const float*)((const char*)matte + y1 * matte_step);
+
+    unsigned char* dst = out + y * out_step + pair * 4;
+    float u = 0.0f, v = 0.0f;
+    for (int k = 0; k < 2; ++k) {
+        int x = 2 * pair + k;
+        float sx = fminf(fmaxf((x + 0.5f) * matte_w / width - 0.5f, 0.0f), matte_w - 1.0f);
+        int x0 = (int)sx;
+        int x1 = min(x0 + 1, matte_w - 1);
+        float fx = sx - x0;
+        float m = (row0[x0] * (1.0f - fx) + row0[x1] * fx) * (1.0f - fy)
+                + (row1[x0] * (1.0f - fx) + row1[x1] * fx) * fy;
+        float a = fminf(fmaxf(m * opacity, 0.0f), 1.0f);
+
+        const unsigned char* f = fg + y * fg_step + x * 3;
+        const unsigned char* g = bg + y * bg_step + x * 3;
+        float b = f[0] * a + g[0] * (1.0f - a);
+        float gr = f[1] * a + g[1] * (1.0f - a);
+        float r = f[2] * a + g[2] * (1.0f - a);
+
+        dst[2 * k] = (unsigned char)(16.0f + (65.481f * r + 128.553f * gr + 24.966f * b) / 255.0f + 0.5f);
+        u += 128.0f + (-37.797f * r - 74.203f * gr + 112.0f * b) / 255.0f;
+        v += 128.0f + (112.0f * r - 93.786f * gr - 18.214f * b) / 255.0f;
+    }
+    dst[1] = (unsigned char)(u * 0.5f + 0.5f);
+    dst[3] = (unsigned char)(v * 0.5f + 0.5f);
+}
+"""
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def blend_q15(fg, bg, matte, scale, out):
+        """out = fg * m + bg * (1 - m), with m = matte * scale quantized to Q15 fixed point, in one pass"""
+        height, width = matte.shape
+        for y in prange(height):
+            for x in range(width):
+                mv = np.int32(min(max(matte[y, x] * scale, 0.0), 1.0) * 32768.0 + 0.5)
+                inv = 32768 - mv
+                for c in range(3):
+                    out[y, x, c] = (np.int32(fg[y, x, c]) * mv + np.int32(bg[y, x, c]) * inv + 16384) >> 15
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def blend_yuyv_u8(fg, bg, matte, scale, out):
+        """Blend fg over bg by matte * scale and pack straight to YUYV, one pixel pair at a time
+
+        Limited-range BT.601 with chroma averaged over each pair, as in the CUDA composite_yuyv kernel.
+        """
+        height, width = matte.shape
+        for y in prange(height):
+            for x in range(0, width, 2):
+                a0 = min(max(matte[y, x] * scale, np.float32(0.0)), np.float32(1.0))
+                a1 = min(max(matte[y, x + 1] * scale, np.float32(0.0)), np.float32(1.0))
+                b0 = bg[y, x, 0] + a0 * (np.float32(fg[y, x, 0]) - bg[y, x, 0])
+                g0 = bg[y, x, 1] + a0 * (np.float32(fg[y, x, 1]) - bg[y, x, 1])
+                r0 = bg[y, x, 2] + a0 * (np.float32(fg[y, x, 2]) - bg[y, x, 2])
+                b1 = bg[y, x + 1, 0] + a1 * (np.float32(fg[y, x + 1, 0]) - bg[y, x + 1, 0])
+                g1 = bg[y, x + 1, 1] + a1 * (np.float32(fg[y, x + 1, 1]) - bg[y, x + 1, 1])
+                r1 = bg[y, x + 1, 2] + a1 * (np.float32(fg[y, x + 1, 2]) - bg[y, x + 1, 2])
+                out[y, x, 0] = np.uint8(np.float32(16.5) + np.float32(0.256788) * r0
+                                        + np.float32(0.504129) * g0 + np.float32(0.097906) * b0)
+                out[y, x + 1, 0] = np.uint8(np.float32(16.5) + np.float32(0.256788) * r1
+                                            + np.float32(0.504129) * g1 + np.float32(0.097906) * b1)
+                # Pair sums, so the chroma coefficients are pre-halved
+                out[y, x, 1] = np.uint8(np.float32(128.5) - np.float32(0.0741118) * (r0 + r1)
+                                        - np.float32(0.1454961) * (g0 + g1) + np.float32(0.2196078) * (b0 + b1))
+                out[y, x + 1, 1] = np.uint8(np.float32(128.5) + np.float32(0.2196078) * (r0 + r1)
+                                            - np.float32(0.1838941) * (g0 + g1) - np.float32(0.0357137) * (b0 + b1))
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def composite_trails(fg, matte, opacity, trail_frames, trail_mattes, slots, trail_opacities,
+                         hue_mats, bg, out):
+        """Layer trails (oldest first, each hue-rotated) then the foreground over bg, in one pass per pixel"""
+        height, width = matte.shape
+        for y in prange(height):
+            for x in range(width):
+                b = np.float32(bg[y, x, 0])
+                g = np.float32(bg[y, x, 1])
+                r = np.float32(bg[y, x, 2])
+                for i in range(slots.shape[0]):
+                    slot = slots[i]
+                    a = trail_mattes[slot, y, x] * trail_opacities[i]
+                    pb = np.float32(trail_frames[slot, y, x, 0])
+                    pg = np.float32(trail_frames[slot, y, x, 1])
+                    pr = np.float32(trail_frames[slot, y, x, 2])
+                    hm = hue_mats[i]
+                    tb = min(max(hm[0, 0] * pb + hm[0, 1] * pg + hm[0, 2] * pr, 0.0), 255.0)
+                    tg = min(max(hm[1, 0] * pb + hm[1, 1] * pg + hm[1, 2] * pr, 0.0), 255.0)
+                    tr = min(max(hm[2, 0] * pb + hm[2, 1] * pg + hm[2, 2] * pr, 0.0), 255.0)
+                    b = tb * a + b * (1.0 - a)
+                    g = tg * a + g * (1.0 - a)
+                    r = tr * a + r * (1.0 - a)
+                a = matte[y, x] * opacity
+                out[y, x, 0] = np.uint8(np.float32(fg[y, x, 0]) * a + b * (1.0 - a) + 0.5)
+                out[y, x, 1] = np.uint8(np.float32(fg[y, x, 1]) * a + g * (1.0 - a) + 0.5)
+                out[y, x, 2] = np.uint8(np.float32(fg[y, x, 2]) * a + r * (1.0 - a) + 0.5)
+
+def make_hue_matrix(degrees):
+    """3x3 BGR matrix rotating hue by degrees (a rotation about the grey axis), for cv2.transform"""
+    theta = np.deg2rad(degrees)
+    cos, sin = np.cos(theta), np.sin(theta)
+    k = sin / np.sqrt(3.0)
+    # Rodrigues rotation about (1, 1, 1) in RGB order
+    rgb = (cos * np.eye(3) + (1.0 - cos) / 3.0
+           + np.array([[0.0, -k, k], [k, 0.0, -k], [-k, k, 0.0]]))
+    return rgb[::-1, ::-1].astype(np.float32)
+
+def make_bgr_model(model_path):
+    """Return the path of a copy of the model that takes BGR input, creating it if needed.
+
+    The channel swap is folded into the first convolution's weights when the input feeds a
+    single Conv, otherwise a Gather on the channel axis is prepended. Returns None if the
+    onnx package isn't installed or the input isn't a 3-channel NCHW tensor.
+    """
+    try:
+        import onnx
+        from onnx import helper, numpy_helper
+    except ImportError:
+        return None
+
+    bgr_path = os.path.splitext(model_path)[0] + '_bgr.onnx'
+    if os.path.exists(bgr_path) and os.path.getmtime(bgr_path) >= os.path.getmtime(model_path):
+        return bgr_path
+
+    model = onnx.load(model_path)
+    graph = model.graph
+    input_value = graph.input[0]
+    input_name = input_value.name
+    dims = input_value.type.tensor_type.shape.dim
+    if len(dims) != 4 or dims[1].dim_value != 3:
+        return None
+
+    consumers = [node for node in graph.node if input_name in node.input]
+    initializers = {init.name: init for init in graph.initializer}
+    first = consumers[0] if len(consumers) == 1 else None
+    weight_init = None
+    if (first is not None and first.op_type == 'Conv' and first.input[0] == input_name
+            and first.input[1] in initializers
+            and sum(first.input[1] in node.input for node in graph.node) == 1):
+        weight_init = initializers[first.input[1]]
+
+    weight = numpy_helper.to_array(weight_init) if weight_init is not None else None
+    if weight is not None and weight.ndim == 4 and weight.shape[1] == 3:
+        # Reorder the first conv's input channels so it consumes BGR directly (zero runtime cost)
+        weight_init.CopyFrom(numpy_helper.from_array(np.ascontiguousarray(weight[:, ::-1]), weight_init.name))
+    else:
+        # Prepend a channel gather BGR -> RGB in front of every consumer of the input
+        rgb_name = input_name + '_rgb'
+        for node in consumers:
+            for i, name in enumerate(node.input):
+                if name == input_name:
+                    node.input[i] = rgb_name
+        indices = numpy_helper.from_array(np.array([2, 1, 0], dtype=np.int64), input_name + '_bgr_order')
+        graph.initializer.append(indices)
+        graph.node.insert(0, helper.make_node('Gather', [input_name, indices.name], [rgb_name], axis=1))
+
+    try:
+        onnx.save(model, bgr_path)
+    except OSError:
+        return None
+    return bgr_path
+
+def make_fp16_model(model_path):
+    """Return the path of an FP16 copy of the model (inputs and outputs stay float32), creating it if needed.
+
+    Returns None if the onnx or onnxconverter_common packages aren't installed.
+    """
+    try:
+        import onnx
+        from onnxconverter_common import float16
+    except ImportError:
+        return None
+
+    fp16_path = os.path.splitext(model_path)[0] + '_fp16.onnx'
+    if os.path.exists(fp16_path) and os.path.getmtime(fp16_path) >= os.path.getmtime(model_path):
+        return fp16_path
+
+    # Keeping float32 I/O means a cast at each end, but the staging tensors and bindings are unchanged
+    model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+    try:
+        onnx.save(model, fp16_path)
+    except OSError:
+        return None
+    return fp16_path
+
+def make_int8_model(model_path, cap, bgr, num_frames=CALIBRATION_FRAMES):
+    """Return the path of a statically INT8-quantized copy of the model, creating it if needed.
+
+    Calibration frames are captured from cap on first use and cached next to the model. The
+    quantized model is rejected (None) if its mattes disagree too much with the original's.
+    """
+    try:
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    except ImportError:
+        return None
+
+    base = os.path.splitext(model_path)[0]
+    int8_path = base + '_int8.onnx'
+    calib_path = base + '_calib.npy'
+
+    # Model-size BGR frames, so the cache is independent of the model's channel order
+    if os.path.exists(calib_path):
+        calib_frames = np.load(calib_path)
+    else:
+        print(f"Capturing {num_frames} calibration frames for INT8 quantization...")
+        calib_frames = []
+        while len(calib_frames) < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            calib_frames.append(cv2.resize(frame, (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), interpolation=cv2.INTER_AREA))
+        if not calib_frames:
+            return None
+        calib_frames = np.stack(calib_frames)
+        np.save(calib_path, calib_frames)
+
+    def to_tensor(small):
+        if not bgr:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        return (small.transpose(2, 0, 1)[None] / 255.0).astype(np.float32)
+
+    input_name = ort.InferenceSession(model_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    if not os.path.exists(int8_path) or os.path.getmtime(int8_path) < os.path.getmtime(model_path):
+        class WebcamCalibReader(CalibrationDataReader):
+            def __init__(self):
+                self.frames = iter(calib_frames)
+
+            def get_next(self):
+                small = next(self.frames, None)
+                return None if small is None else {input_name: to_tensor(small)}
+
+        print("Quantizing model to INT8 (one-off)...")
+        # Symmetric QDQ is the form TensorRT can consume as explicit quantization
+        quantize_static(model_path, int8_path, WebcamCalibReader(),
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QInt8, weight_type=QuantType.QInt8,
+                        extra_options={'ActivationSymmetric': True, 'WeightSymmetric': True})
+
+    # Segmentation heads often quantize poorly, so compare binarized mattes on a few frames
+    ref_session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    int8_session = ort.InferenceSession(int8_path, providers=['CPUExecutionProvider'])
+    ious = []
+    for small in calib_frames[::max(1, len(calib_frames) // 16)]:
+        feed = {input_name: to_tensor(small)}
+        ref = ref_session.run(None, feed)[0] > 0.5
+        quant = int8_session.run(None, feed)[0] > 0.5
+        union = np.count_nonzero(ref | quant)
+        ious.append(np.count_nonzero(ref & quant) / union if union else 1.0)
+    iou = float(np.mean(ious))
+    if iou < INT8_MIN_IOU:
+        print(f"INT8 matte IoU {iou:.3f} is below {INT8_MIN_IOU}, not using the INT8 model")
+        return None
+    print(f"INT8 matte IoU vs original: {iou:.3f}")
+    return int8_path
 
 class CamolaGPU:
     def __init__(self, model_path, input_device=0, output_device="/dev/video10",
@@ -26,8 +355,12 @@ class CamolaGPU:
                  trails_pixelate=False, trails_hue_shift=0,
                  plasma_enabled=False, plasma_speed=1.0, plasma_scale=0.02, plasma_palette="classic",
                  foreground_opacity=1.0, foreground_saturation=1.0,
-                 fps=30):
+                 trt_cache_path="./trt_cache", static_threshold=2, batch_size=1,
+                 precision="fp16", fps=30):
 
+        # YUYV packs pixel pairs, so the output (and every kernel writing it) needs an even width
+        if output_width % 2:
+            raise ValueError(f"Output width must be even for YUYV output, got {output_width}")
         self.output_width = output_width
         self.output_height = output_height
         self.target_fps = fps
@@ -40,14 +373,29 @@ class CamolaGPU:
         self.foreground_effect = foreground_effect
 
         # Trails effect settings
-        self.trails_enabled = trails_enabled
+        # No trail slots means nothing to show (as with the old zero-length deque), so treat it as off
+        self.trails_enabled = trails_enabled and trails_count > 0
         self.trails_interval = trails_interval
         self.trails_count = trails_count
         self.trails_fade_start = trails_fade_start
         self.trails_fade_end = trails_fade_end
         self.trails_pixelate = trails_pixelate
         self.trails_hue_shift = trails_hue_shift
-        self.trails_buffer = deque(maxlen=trails_count)
+        # Trail snapshots live in preallocated stacks used as a ring buffer: premultiplied
+        # foreground and matte per slot, oldest at (_trail_next - _trail_filled) % trails_count
+        if self.trails_enabled:
+            self._trail_frames = np.empty((trails_count, output_height, output_width, 3), dtype=np.uint8)
+            self._trail_mattes = np.empty((trails_count, output_height, output_width), dtype=np.float32)
+            self._trail_result = np.empty((output_height, output_width, 3), dtype=np.uint8)
+            if trails_pixelate:
+                self._trail_pix_small = np.empty((output_height // pixel_size, output_width // pixel_size, 3),
+                                                 dtype=np.uint8)
+                self._trail_pix_up = np.empty((output_height, output_width, 3), dtype=np.uint8)
+        # Per-trail hue rotations, fixed for the run (hue shift is in OpenCV's 0-180 hue units)
+        if self.trails_enabled:
+            self._hue_mats = np.stack([make_hue_matrix(2.0 * trails_hue_shift * i) for i in range(trails_count)])
+        self._trail_next = 0
+        self._trail_filled = 0
         self.frame_counter = 0
 
         # Plasma effect settings
@@ -61,16 +409,42 @@ class CamolaGPU:
         self.foreground_opacity = foreground_opacity
         self.foreground_saturation = foreground_saturation
 
+        # Reused composite buffers (output-size foreground, matte and blended result)
+        self._resized_buf = np.empty((output_height, output_width, 3), dtype=np.uint8)
+        self._matte_resized_buf = np.empty((output_height, output_width), dtype=np.float32)
+        self._out_buf = np.empty((output_height, output_width, 3), dtype=np.uint8)
+
+        # Reused pixelation buffers (downscaled blocks and their nearest-neighbour upscale)
+        if pixelate_background:
+            self._pix_small = np.empty((output_height // pixel_size, output_width // pixel_size, 3), dtype=np.uint8)
+            self._pix_up = np.empty((output_height, output_width, 3), dtype=np.uint8)
+
         # Temporal smoothing for matte stability
         self.prev_matte = None
         self.temporal_alpha = 0.3  # Blend factor: higher = more weight on current frame
 
+        # Static-frame skip: max per-pixel thumbnail difference that still reuses the last cleaned
+        # matte (temporal smoothing keeps running on it, so the output still settles)
+        self.static_threshold = static_threshold
+        self._last_thumb = None
+
+        # Matte cleanup kernels are constant, so build them once
+        self._morph_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self._gauss3 = cv2.getGaussianKernel(3, 0, ktype=cv2.CV_32F)
+        # Scratch buffers for the intermediate steps of the CPU cleanup chain
+        self._matte_tmp = np.empty((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dtype=np.float32)
+        self._matte_tmp2 = np.empty((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dtype=np.float32)
+        # Last cleaned matte before temporal smoothing, kept for static-frame skips
+        self._matte_clean = np.empty((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dtype=np.float32)
+
         # Initialize webcam capture
         print(f"Initializing webcam {input_device} at {capture_width}x{capture_height}", flush=True)
         self.cap = cv2.VideoCapture(input_device)
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, capture_width)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, capture_height)
         self.cap.set(cv2.CAP_PROP_FPS, fps)
+        # Keep the driver queue shallow so reads return the newest frame
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
         if not self.cap.isOpened():
             raise RuntimeError("Failed to open webcam")
@@ -81,33 +455,220 @@ class CamolaGPU:
 
         # Initialize v4l2loopback output
         print(f"Opening v4l2loopback device at {output_device} ({output_width}x{output_height})")
-        self.output_device = open(output_device, 'wb')
+        # Raw fd: frames go straight to the driver without Python's buffered IO layer
+        self.out_fd = os.open(output_device, os.O_WRONLY)
 
         # Set format using v4l2 ioctl
-        import struct
-        VIDIOC_S_FMT = 0xc0d05605
-        V4L2_BUF_TYPE_VIDEO_OUTPUT = 2
-        V4L2_PIX_FMT_YUYV = 0x56595559  # YUYV 4:2:2 format (standard webcam format)
-
-        # Build v4l2_format structure (208 bytes)
-        fmt = bytearray(208)
-        struct.pack_into('I', fmt, 0, V4L2_BUF_TYPE_VIDEO_OUTPUT)  # type
-        struct.pack_into('I', fmt, 8, output_width)  # width
-        struct.pack_into('I', fmt, 12, output_height)  # height
-        struct.pack_into('I', fmt, 16, V4L2_PIX_FMT_YUYV)  # pixelformat
-
-        fcntl.ioctl(self.output_device, VIDIOC_S_FMT, fmt)
+        fmt = v4l2_format(type=V4L2_BUF_TYPE_VIDEO_OUTPUT)
+        fmt.fmt.pix.width = output_width
+        fmt.fmt.pix.height = output_height
+        fmt.fmt.pix.pixelformat = V4L2_PIX_FMT_YUYV
+
+        fcntl.ioctl(self.out_fd, VIDIOC_S_FMT, fmt)
         print("v4l2loopback device configured")
 
-        # Load segmentation model with CUDA
+        # Rotating YUYV output buffers: one being filled, up to two queued for the writer thread and
+        # one being written. Page-locked when possible so GPU-packed frames download by DMA
+        self._yuyv_bufs = [np.empty((output_height, output_width, 2), dtype=np.uint8) for _ in range(4)]
+        self._yuyv_index = 0
+        self.write_queue = None
+        if HAS_CV2_CUDA:
+            for buf in self._yuyv_bufs:
+                cv2.cuda.registerPageLocked(buf)
+
+        # Device-side YUYV packing for frames that are already on the GPU
+        if HAS_CV2_CUDA:
+            self._out_stream = cv2.cuda_Stream()
+            self._gpu_out = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC3)
+            self._gpu_ycrcb = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC3)
+            self._gpu_ycrcb_planes = [cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC1) for _ in range(3)]
+            self._gpu_chroma_half = [cv2.cuda_GpuMat(output_height, output_width // 2, cv2.CV_8UC1) for _ in range(2)]
+            self._gpu_uv = cv2.cuda_GpuMat(output_height, output_width // 2, cv2.CV_8UC2)
+            self._gpu_yuyv = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC2)
+
+        # Load segmentation model, preferring TensorRT (cached engines) over plain CUDA
         print(f"Loading segmentation model: {model_path}")
-        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
-        self.session = ort.InferenceSession(model_path, providers=providers)
+
+        # Prefer a variant that takes BGR input directly, so preprocessing can skip the channel swap
+        bgr_model_path = make_bgr_model(model_path)
+        self.model_bgr = bgr_model_path is not None
+        if self.model_bgr:
+            print(f"Using BGR-input model variant: {bgr_model_path}")
+            model_path = bgr_model_path
+
+        # INT8 needs a quantized model (QDQ) and, on the GPU, TensorRT: the plain CUDA provider has no
+        # INT8 kernels and would only run the extra Q/DQ nodes. Fall back to FP16 there, or if the
+        # model can't be made or is inaccurate
+        available = ort.get_available_providers()
+        if (precision == 'int8' and 'CUDAExecutionProvider' in available
+                and 'TensorrtExecutionProvider' not in available):
+            print("INT8 needs TensorRT on the GPU, using FP16")
+            precision = 'fp16'
+        if precision == 'int8':
+            int8_model_path = make_int8_model(model_path, self.cap, self.model_bgr)
+            if int8_model_path is None:
+                print("INT8 model unavailable, using FP16")
+                precision = 'fp16'
+            else:
+                print(f"Using INT8 model: {int8_model_path}")
+                model_path = int8_model_path
+
+        # TensorRT builds FP16 engines itself; the plain CUDA provider needs an FP16 model
+        if (precision == 'fp16' and 'CUDAExecutionProvider' in available
+                and 'TensorrtExecutionProvider' not in available):
+            fp16_model_path = make_fp16_model(model_path)
+            if fp16_model_path is not None:
+                print(f"Using FP16 model: {fp16_model_path}")
+                model_path = fp16_model_path
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.enable_mem_pattern = True
+        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        cuda_available = 'CUDAExecutionProvider' in available
+        if cuda_available:
+            # Tensors live on the GPU, so the CPU arena would only hold memory
+            sess_options.enable_cpu_mem_arena = False
+            # ...and ONNX Runtime's CPU thread pools would only compete with OpenCV and Numba
+            # in the other pipeline stages, so keep them to one thread and cap OpenCV too
+            sess_options.intra_op_num_threads = 1
+            sess_options.inter_op_num_threads = 1
+            cv2.setNumThreads(2)
+
+        # Pin any symbolic input dims to Bx3x320x320 so TensorRT builds a single static engine
+        probe = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        probe_shape = probe.get_inputs()[0].shape
+        del probe
+        if batch_size > 1 and not isinstance(probe_shape[0], str):
+            print(f"Model has a fixed batch dimension ({probe_shape[0]}), ignoring --batch-size {batch_size}")
+            batch_size = 1
+        self.batch_size = batch_size
+        static_shape = (batch_size, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+        for dim, size in zip(probe_shape, static_shape):
+            if isinstance(dim, str):
+                sess_options.add_free_dimension_override_by_name(dim, size)
+
+        provider_options = {
+            'TensorrtExecutionProvider': {
+                # FP16 stays on for INT8 so layers without INT8 kernels don't drop to FP32
+                'trt_fp16_enable': str(precision != 'fp32'),
+                'trt_int8_enable': str(precision == 'int8'),
+                'trt_engine_cache_enable': 'True',
+                'trt_engine_cache_path': trt_cache_path,
+                'trt_max_workspace_size': 2 << 30,
+            },
+            'CUDAExecutionProvider': {
+                'device_id': 0,
+                'cudnn_conv_algo_search': 'EXHAUSTIVE',
+                'arena_extend_strategy': 'kSameAsRequested',
+                'do_copy_in_default_stream': 1,
+            },
+            'CPUExecutionProvider': {},
+        }
+        providers = [p for p in provider_options if p in available]
+        provider_option_list = [provider_options[p] for p in providers]
+        if 'TensorrtExecutionProvider' in providers:
+            # Only TensorRT writes engines; don't leave an empty cache directory behind otherwise
+            os.makedirs(trt_cache_path, exist_ok=True)
+        self.session = None
+        if cuda_available:
+            # Without the CPU fallback, session creation fails unless every node runs on the GPU
+            sess_options.add_session_config_entry('session.disable_cpu_ep_fallback', '1')
+            try:
+                self.session = ort.InferenceSession(model_path, sess_options=sess_options,
+                                                    providers=providers[:-1],
+                                                    provider_options=provider_option_list[:-1])
+                print("All model nodes placed on the GPU, CPU provider dropped")
+            except OrtFail:
+                sess_options.add_session_config_entry('session.disable_cpu_ep_fallback', '0')
+        if self.session is None:
+            self.session = ort.InferenceSession(model_path, sess_options=sess_options,
+                                                providers=providers,
+                                                provider_options=provider_option_list)
         print(f"ONNX Runtime providers: {self.session.get_providers()}")
+        print(f"ONNX Runtime provider options: {self.session.get_provider_options()}")
         self.input_name = self.session.get_inputs()[0].name
-
-        # Prepare background
+        self.output_name = self.session.get_outputs()[0].name
+
+        # Persistent input/output tensors, bound once and refreshed in place per frame
+        ort_device = 'cuda' if 'CUDAExecutionProvider' in self.session.get_providers() else 'cpu'
+        self.ort_device = ort_device
+        input_shape = [batch_size, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE]
+        output_shape = [dim if isinstance(dim, int) else default for dim, default in
+                        zip(self.session.get_outputs()[0].shape, [batch_size, 1, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE])]
+
+        # Host staging buffers for preprocessing, reused every frame
+        self._input_hwc = np.empty((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3), dtype=np.uint8)
+        self._input_nchw = np.empty(input_shape, dtype=np.float32)
+
+        # Preprocess on the GPU when both OpenCV and ONNX Runtime can use CUDA; the input is then
+        # a GpuMat bound below, so no device input tensor is allocated here
+        self.gpu_preprocess = HAS_CV2_CUDA and ort_device == 'cuda'
+        self.io_binding = self.session.io_binding()
+        if ort_device == 'cuda':
+            if not self.gpu_preprocess:
+                self.input_ort = ort.OrtValue.ortvalue_from_shape_and_type(input_shape, np.float32, ort_device, 0)
+            self.output_ort = ort.OrtValue.ortvalue_from_shape_and_type(output_shape, np.float32, ort_device, 0)
+        else:
+            # On the CPU the bound tensors wrap the host buffers themselves, so nothing is copied
+            self._output_host = np.empty(output_shape, dtype=np.float32)
+            self.input_ort = ort.OrtValue.ortvalue_from_numpy(self._input_nchw)
+            self.output_ort = ort.OrtValue.ortvalue_from_numpy(self._output_host)
+        if not self.gpu_preprocess:
+            self.io_binding.bind_ortvalue_input(self.input_name, self.input_ort)
+        self.io_binding.bind_ortvalue_output(self.output_name, self.output_ort)
+
+        if self.gpu_preprocess:
+            size = MODEL_INPUT_SIZE
+            self._gpu_stream = cv2.cuda_Stream()
+            self._gpu_frame = cv2.cuda_GpuMat()
+            self._gpu_small = cv2.cuda_GpuMat()
+            self._gpu_rgb = cv2.cuda_GpuMat()
+            self._gpu_input_f32 = cv2.cuda_GpuMat()
+            # Continuous (B*3*size)x(size) float image whose row bands are each image's R, G and B
+            # planes, i.e. exactly the memory layout of the Bx3xSxS NCHW input tensor
+            # (without a GpuMat to fill, the binding picks the host-Mat overload and returns an ndarray)
+            self._gpu_nchw = cv2.cuda.createContinuous(batch_size * 3 * size, size, cv2.CV_32FC1,
+                                                       cv2.cuda_GpuMat())
+            self._gpu_planes = [[cv2.cuda_GpuMat(self._gpu_nchw, (0, (3 * b + c) * size, size, size))
+                                 for c in range(3)] for b in range(batch_size)]
+            self.io_binding.bind_input(self.input_name, 'cuda', 0, np.float32, input_shape,
+                                       self._gpu_nchw.cudaPtr())
+            print("Preprocessing on GPU (OpenCV CUDA)")
+
+        # Post-process the matte on the GPU too, with the model writing straight into a GpuMat
+        self.gpu_postprocess = (self.gpu_preprocess and
+                                int(np.prod(output_shape)) == batch_size * MODEL_INPUT_SIZE ** 2)
+        if self.gpu_postprocess:
+            size = MODEL_INPUT_SIZE
+            self._gpu_matte_raw = cv2.cuda.createContinuous(batch_size * size, size, cv2.CV_32FC1, cv2.cuda_GpuMat())
+            self._gpu_matte_slots = [cv2.cuda_GpuMat(self._gpu_matte_raw, (0, b * size, size, size))
+                                     for b in range(batch_size)]
+            self.io_binding.bind_output(self.output_name, 'cuda', 0, np.float32, output_shape,
+                                        self._gpu_matte_raw.cudaPtr())
+            self._gpu_matte = cv2.cuda_GpuMat()
+            self._gpu_matte_tmp = cv2.cuda_GpuMat()
+            self._gpu_matte_clean = cv2.cuda_GpuMat()
+            self._gpu_prev_matte = cv2.cuda_GpuMat()
+            self._gpu_gauss3 = cv2.cuda.createGaussianFilter(cv2.CV_32FC1, cv2.CV_32FC1, (3, 3), 0)
+            self._gpu_morph_open = cv2.cuda.createMorphologyFilter(cv2.MORPH_OPEN, cv2.CV_32FC1,
+                                                                   self._morph_kernel)
+            print("Matte post-processing on GPU (OpenCV CUDA)")
+
+        # Warm-up inference, so cuDNN algorithm search and TensorRT engine setup happen here
+        # rather than on the first live frame
+        self._input_nchw.fill(0.0)
+        if self.gpu_preprocess:
+            self._gpu_nchw.setTo(0.0)
+        elif self.ort_device == 'cuda':
+            self.input_ort.update_inplace(self._input_nchw)
+        warmup_start = time.time()
+        self.session.run_with_iobinding(self.io_binding)
+        print(f"Warm-up inference: {(time.time() - warmup_start) * 1000:.0f}ms")
+
+        # Prepare background; while the pipeline runs, video frames are prefetched by their own stage
         self.background_video_cap = None
+        self.background_queue = None
+        self._background_frame = None
         if background_color:
             # Parse hex color
             color_hex = background_color.lstrip('#')
@@ -132,71 +693,199 @@ class CamolaGPU:
             self.background = None
             print("No background replacement")
 
+        # Composite on the GPU and hand the result straight to the GPU YUYV writer, when no
+        # CPU-only effect (stylization, HSV tweaks, plasma, trails) is involved
+        self.gpu_composite = (HAS_CV2_CUDA and not plasma_enabled and not self.trails_enabled
+                              and not foreground_effect and foreground_saturation == 1.0)
+        if self.gpu_composite:
+            self._gpu_comp_frame = cv2.cuda_GpuMat()
+            self._gpu_comp_fg = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC3)
+            self._gpu_comp_matte_small = cv2.cuda_GpuMat(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, cv2.CV_32FC1)
+            self._gpu_comp_matte = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_32FC1)
+            self._gpu_comp_weight_bg = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_32FC1)
+            self._gpu_comp_bg = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC3)
+            if self.background is not None:
+                # Static backgrounds are uploaded once
+                self._gpu_background = cv2.cuda_GpuMat(self.background)
+            if pixelate_background:
+                self._gpu_pix_small = cv2.cuda_GpuMat(output_height // pixel_size, output_width // pixel_size,
+                                                      cv2.CV_8UC3)
+                self._gpu_pix_up = cv2.cuda_GpuMat(output_height, output_width, cv2.CV_8UC3)
+            print("Compositing on GPU (OpenCV CUDA)")
+
+            # With CuPy, blend and YUYV packing fuse into one kernel sharing OpenCV's output stream
+            self._composite_kernel = None
+            if HAS_CUPY:
+                self._composite_kernel = cp.RawKernel(COMPOSITE_YUYV_SOURCE, 'composite_yuyv')
+                self._cp_out_stream = cp.cuda.ExternalStream(self._out_stream.cudaPtr())
+                print("Fused composite + YUYV kernel (CuPy)")
+
         print("Camola GPU initialized")
 
+    def preprocess_cpu(self, frame, slot=0):
+        """Convert frame to the normalized NCHW model input (batch index slot) on the CPU"""
+        # Resize to model input size first, so the channel swap only touches model-sized data
+        cv2.resize(frame, (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dst=self._input_hwc)
+
+        # Convert BGR to RGB in place, unless the model was rewritten to take BGR
+        if not self.model_bgr:
+            cv2.cvtColor(self._input_hwc, cv2.COLOR_BGR2RGB, dst=self._input_hwc)
+
+        # Normalize and convert to NCHW directly into the staging tensor
+        np.divide(self._input_hwc.transpose(2, 0, 1), 255.0, out=self._input_nchw[slot], dtype=np.float32)
+
+    def preprocess_gpu(self, frame, slot=0):
+        """Convert frame to the model input on the GPU, writing straight into the bound device buffer"""
+        stream = self._gpu_stream
+        self._gpu_frame.upload(frame, stream)
+
+        # Resize first so the channel swap and normalization only touch model-sized data
+        cv2.cuda.resize(self._gpu_frame, (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), dst=self._gpu_small, stream=stream)
+        small = self._gpu_small
+        if not self.model_bgr:
+            cv2.cuda.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self._gpu_rgb, stream=stream)
+            small = self._gpu_rgb
+        small.convertTo(cv2.CV_32FC3, 1.0 / 255.0, 0.0, stream, self._gpu_input_f32)
+
+        # De-interleave HWC into the three NCHW planes of the input tensor
+        cv2.cuda.split(self._gpu_input_f32, self._gpu_planes[slot], stream=stream)
+
     def segment(self, frame):
-        """Run segmentation on frame and return alpha matte"""
-        h, w = frame.shape[:2]
+        """Run segmentation on frame and return alpha matte (at model resolution)"""
+        return self.segment_batch([frame])[0]
+
+    def segment_batch(self, frames):
+        """Segment up to batch_size frames with a single inference call; return one matte per frame"""
+        # Reuse the last cleaned matte when the newest frame is (near-)identical to the last segmented
+        # one, judged on a small area-averaged thumbnail so sensor noise doesn't defeat the check.
+        # Only inference and cleanup are skipped: each frame still takes its temporal smoothing step,
+        # so a matte that was mid-transition keeps converging while the person holds still
+        thumb = cv2.resize(frames[-1], (64, 64), interpolation=cv2.INTER_AREA)
+        if (self._last_thumb is not None
+                and cv2.norm(thumb, self._last_thumb, cv2.NORM_INF) <= self.static_threshold):
+            smooth = self.smooth_matte_gpu if self.gpu_postprocess else self.smooth_matte_cpu
+            return [smooth() for _ in frames]
+        self._last_thumb = thumb
+
+        # Fill the bound model input, then run inference on the pre-bound tensors
+        # (unused slots of a partial batch are computed but ignored)
+        for slot, frame in enumerate(frames):
+            if self.gpu_preprocess:
+                self.preprocess_gpu(frame, slot)
+            else:
+                self.preprocess_cpu(frame, slot)
+        if self.gpu_preprocess:
+            # ONNX Runtime runs on its own stream, so the input must be complete before inference
+            self._gpu_stream.waitForCompletion()
+        elif self.ort_device == 'cuda':
+            self.input_ort.update_inplace(self._input_nchw)
+        self.session.run_with_iobinding(self.io_binding)
+
+        # Post-process in frame order so temporal smoothing runs across the batch. Mattes stay at
+        # model resolution; composite() upsamples once, straight to the output size
+        if self.gpu_postprocess:
+            mattes = [self.postprocess_gpu(slot) for slot in range(len(frames))]
+        else:
+            output = self.output_ort.numpy() if self.ort_device == 'cuda' else self._output_host
+            mattes = [self.postprocess_cpu(output[slot, 0]) for slot in range(len(frames))]
+        return mattes
+
+    def postprocess_gpu(self, slot):
+        """Clean up and temporally smooth one bound model output on the GPU; return it on the host"""
+        stream = self._gpu_stream
 
-        # Convert BGR to RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Blur / open / blur as on the CPU path
+        self._gpu_gauss3.apply(self._gpu_matte_slots[slot], self._gpu_matte_tmp, stream)
+        self._gpu_morph_open.apply(self._gpu_matte_tmp, self._gpu_matte, stream)
+        self._gpu_gauss3.apply(self._gpu_matte, self._gpu_matte_clean, stream)
+        return self.smooth_matte_gpu()
 
-        # Resize to model input size (320x320)
-        frame_resized = cv2.resize(frame_rgb, (320, 320))
+    def smooth_matte_gpu(self):
+        """Temporally smooth the last cleaned device matte; return the result on the host"""
+        stream = self._gpu_stream
+        matte = self._gpu_matte_tmp
 
-        # Normalize and convert to NCHW
-        frame_normalized = frame_resized.astype(np.float32) / 255.0
-        frame_tensor = np.transpose(frame_normalized, (2, 0, 1))[np.newaxis, ...]
+        # Temporal smoothing to reduce flicker
+        if self._gpu_prev_matte.empty():
+            self._gpu_matte_clean.copyTo(stream, matte)
+        else:
+            cv2.cuda.addWeighted(self._gpu_matte_clean, self.temporal_alpha, self._gpu_prev_matte,
+                                 1 - self.temporal_alpha, 0.0, dst=matte, stream=stream)
 
-        # Run inference
-        output = self.session.run(None, {self.input_name: frame_tensor})[0]
+        # Keep this frame's matte on the device for the next EMA step (swap, no copy)
+        self._gpu_prev_matte, self._gpu_matte_tmp = matte, self._gpu_prev_matte
 
-        # Resize matte back to original size
-        matte = cv2.resize(output[0, 0], (w, h))
+        host_matte = matte.download(stream)
+        stream.waitForCompletion()
+        return host_matte
 
-        # Apply Gaussian blur to soften edges
-        matte = cv2.GaussianBlur(matte, (7, 7), 0)
+    def postprocess_cpu(self, matte):
+        """Clean up and temporally smooth a model-resolution matte on the CPU"""
+        # Apply Gaussian blur (3x3, separable) to soften edges
+        matte = cv2.sepFilter2D(matte, -1, self._gauss3, self._gauss3, dst=self._matte_tmp)
 
         # Optional: Apply morphological operations to clean up the matte
-        # Slight erosion followed by dilation to remove small noise
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        matte = cv2.erode(matte, kernel, iterations=1)
-        matte = cv2.dilate(matte, kernel, iterations=1)
+        # Opening (slight erosion followed by dilation) removes small noise
+        matte = cv2.morphologyEx(matte, cv2.MORPH_OPEN, self._morph_kernel, dst=self._matte_tmp2)
 
-        # Apply another small blur after morphological ops
-        matte = cv2.GaussianBlur(matte, (5, 5), 0)
+        # Apply another small blur after morphological ops, keeping the cleaned matte for skipped frames
+        cv2.sepFilter2D(matte, -1, self._gauss3, self._gauss3, dst=self._matte_clean)
+        return self.smooth_matte_cpu()
 
-        # Temporal smoothing to reduce flicker
-        if self.prev_matte is not None:
-            # Exponential moving average: blend current with previous
-            matte = self.temporal_alpha * matte + (1 - self.temporal_alpha) * self.prev_matte
+    def smooth_matte_cpu(self):
+        """Temporally smooth the last cleaned matte to reduce flicker; always returns a new array"""
+        if self.prev_matte is None:
+            matte = self._matte_clean.copy()
+        else:
+            # Exponential moving average: blend current with previous in one pass
+            matte = cv2.addWeighted(self._matte_clean, self.temporal_alpha, self.prev_matte,
+                                    1 - self.temporal_alpha, 0.0)
 
-        # Store for next frame
-        self.prev_matte = matte.copy()
+        # Store for next frame; the result is a fresh array, so no copy is needed
+        self.prev_matte = matte
 
         return matte
 
     def apply_foreground_effect(self, frame):
         """Apply artistic effect to foreground (person)"""
+        if self.foreground_effect not in ('cartoon', 'sketch', 'sketch_bw'):
+            return frame
+
+        # The edge-preserving filters cost O(pixels * sigma_s^2); run them at half size
+        # (sigma_s halved to match) and upscale - the soft matte hides the difference
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (width // 2, height // 2), interpolation=cv2.INTER_AREA)
         if self.foreground_effect == 'cartoon':
             # Cartoon effect using stylization
-            cartoon = cv2.stylization(frame, sigma_s=150, sigma_r=0.25)
-            return cartoon
-        elif self.foreground_effect == 'sketch':
-            # Pencil sketch effect (grayscale)
-            sketch_gray, sketch_color = cv2.pencilSketch(frame, sigma_s=60, sigma_r=0.07, shade_factor=0.05)
-            return sketch_color
-        elif self.foreground_effect == 'sketch_bw':
-            # Black and white sketch
-            sketch_gray, sketch_color = cv2.pencilSketch(frame, sigma_s=60, sigma_r=0.07, shade_factor=0.05)
-            return cv2.cvtColor(sketch_gray, cv2.COLOR_GRAY2BGR)
-        return frame
+            styled = cv2.stylization(small, sigma_s=75, sigma_r=0.25)
+        else:
+            sketch_gray, sketch_color = cv2.pencilSketch(small, sigma_s=30, sigma_r=0.07, shade_factor=0.05)
+            if self.foreground_effect == 'sketch':
+                # Pencil sketch effect (colour)
+                styled = sketch_color
+            else:
+                # Black and white sketch
+                styled = cv2.cvtColor(sketch_gray, cv2.COLOR_GRAY2BGR)
+        return cv2.resize(styled, (width, height), interpolation=cv2.INTER_LINEAR)
 
     def get_background_frame(self):
-        """Get next frame from background video (with looping)"""
+        """Get next background frame: static background, prefetched or freshly decoded video frame"""
         if self.background_video_cap is None:
             return self.background
 
+        if self.background_queue is not None:
+            # Pipeline running: only the background stage touches the video; repeat the last frame if it lags
+            try:
+                self._background_frame = self.background_queue.get(block=self._background_frame is None,
+                                                                   timeout=self.frame_duration)
+            except queue.Empty:
+                pass
+            return self._background_frame
+
+        return self.read_background_frame()
+
+    def read_background_frame(self):
+        """Decode the next frame from background video (with looping), at output size"""
         ret, bg_frame = self.background_video_cap.read()
         if not ret:
             # End of video, loop back to start
@@ -206,8 +895,9 @@ class CamolaGPU:
                 # Fallback to None if still failing
                 return None
 
-        # Resize to output size
-        bg_frame = cv2.resize(bg_frame, (self.output_width, self.output_height))
+        # Resize to output size (skipped when the video already matches)
+        if bg_frame.shape[:2] != (self.output_height, self.output_width):
+            bg_frame = cv2.resize(bg_frame, (self.output_width, self.output_height))
         return bg_frame
 
     def get_plasma_palette(self, value):
@@ -347,14 +1037,131 @@ class CamolaGPU:
 
         return frame
 
+    def blend_yuyv(self, foreground, background, matte, opacity=1.0):
+        """Blend as in blend(), returning packed YUYV for write_frame when Numba can fuse the conversion"""
+        if not HAS_NUMBA:
+            return self.blend(foreground, background, matte, opacity)
+        # Blend and pack in one pass, skipping the BGR intermediate and cvtColor's extra frame read
+        frame_yuyv = self._next_yuyv_buf()
+        blend_yuyv_u8(foreground, background, matte, np.float32(opacity), frame_yuyv)
+        return frame_yuyv
+
+    def blend(self, foreground, background, matte, opacity=1.0, out=None):
+        """Alpha-blend foreground over background using a single-channel float matte
+
+        The result goes to out (which may be background itself) or the shared output buffer.
+        """
+        if HAS_NUMBA:
+            if out is None:
+                out = self._out_buf
+            # Quantize the matte and blend in a single fused fixed-point pass
+            blend_q15(foreground, background, matte, np.float32(opacity), out)
+            return out
+
+        # Trailing size-1 axis broadcasts across channels without a 3-channel copy
+        final_matte = matte[..., None] * opacity
+        return (foreground * final_matte + background * (1 - final_matte)).astype(np.uint8)
+
+    def composite_gpu(self, frame, matte):
+        """Composite foreground onto background on the GPU
+
+        Returns the output-size BGR GpuMat, or with the fused kernel the packed YUYV host frame.
+        """
+        stream = self._out_stream
+        size = (self.output_width, self.output_height)
+
+        self._gpu_comp_frame.upload(frame, stream)
+        foreground = self._gpu_comp_frame
+        if frame.shape[:2] != (self.output_height, self.output_width):
+            cv2.cuda.resize(foreground, size, dst=self._gpu_comp_fg, stream=stream)
+            foreground = self._gpu_comp_fg
+
+        # Only the small model-resolution matte crosses the bus; it is upsampled on the device
+        self._gpu_comp_matte_small.upload(matte, stream)
+
+        if self.pixelate_background:
+            cv2.cuda.resize(foreground, (self.output_width // self.pixel_size, self.output_height // self.pixel_size),
+                            dst=self._gpu_pix_small, interpolation=cv2.INTER_LINEAR, stream=stream)
+            if self.invert_background:
+                cv2.cuda.bitwise_not(self._gpu_pix_small, dst=self._gpu_pix_small, stream=stream)
+            cv2.cuda.resize(self._gpu_pix_small, size, dst=self._gpu_pix_up,
+                            interpolation=cv2.INTER_NEAREST, stream=stream)
+            background = self._gpu_pix_up
+        else:
+            background = self.get_background_frame()
+            if background is None:
+                background = foreground
+            elif background is self.background:
+                background = self._gpu_background
+            else:
+                self._gpu_comp_bg.upload(background, stream)
+                background = self._gpu_comp_bg
+
+        opacity = self.foreground_opacity
+        if self._composite_kernel is not None:
+            return self.composite_yuyv_fused(foreground, background, opacity)
+
+        cv2.cuda.resize(self._gpu_comp_matte_small, size, dst=self._gpu_comp_matte,
+                        interpolation=cv2.INTER_LINEAR, stream=stream)
+        # Per-pixel weights m * opacity and 1 - m * opacity for a normalized linear blend
+        self._gpu_comp_matte.convertTo(cv2.CV_32FC1, -opacity, 1.0, stream, self._gpu_comp_weight_bg)
+        if opacity != 1.0:
+            self._gpu_comp_matte.convertTo(cv2.CV_32FC1, opacity, 0.0, stream, self._gpu_comp_matte)
+        cv2.cuda.blendLinear(foreground, background, self._gpu_comp_matte, self._gpu_comp_weight_bg,
+                             self._gpu_out, stream)
+        return self._gpu_out
+
+    def composite_yuyv_fused(self, foreground, background, opacity):
+        """Blend and pack to YUYV in one CuPy kernel; return the packed frame in a host output buffer"""
+        matte = self._gpu_comp_matte_small
+        matte_w, matte_h = matte.size()
+        out = self._gpu_yuyv
+        block = (32, 8)
+        grid = ((self.output_width // 2 + block[0] - 1) // block[0], (self.output_height + block[1] - 1) // block[1])
+        with self._cp_out_stream:
+            self._composite_kernel(grid, block, (
+                np.uint64(foreground.cudaPtr()), np.int64(foreground.step),
+                np.uint64(background.cudaPtr()), np.int64(background.step),
+                np.uint64(matte.cudaPtr()), np.int64(matte.step), np.int32(matte_w), np.int32(matte_h),
+                np.float32(opacity), np.uint64(out.cudaPtr()), np.int64(out.step),
+                np.int32(self.output_width), np.int32(self.output_height)))
+
+        # Single device-to-host copy per frame, into a page-locked output buffer
+        frame_yuyv = self._next_yuyv_buf()
+        out.download(self._out_stream, frame_yuyv)
+        self._out_stream.waitForCompletion()
+        return frame_yuyv
+
+    def pixelate(self, frame, small, out, invert=False):
+        """Pixelate frame into out in pixel_size blocks, using small (one pixel per block) as scratch"""
+        h, w = frame.shape[:2]
+        # Downscale to pixelate
+        cv2.resize(frame, (w // self.pixel_size, h // self.pixel_size), dst=small, interpolation=cv2.INTER_LINEAR)
+
+        # Apply color inversion if requested (on the small image: pixel_size^2 fewer pixels)
+        if invert:
+            np.subtract(255, small, out=small)
+
+        # Upscale back using nearest neighbor to keep blocky pixels
+        return cv2.resize(small, (w, h), dst=out, interpolation=cv2.INTER_NEAREST)
+
     def composite(self, frame, matte):
-        """Composite foreground onto background using matte"""
-        # Resize frame to output size
-        frame_resized = cv2.resize(frame, (self.output_width, self.output_height))
-        matte_resized = cv2.resize(matte, (self.output_width, self.output_height))
+        """Composite foreground onto background using matte
 
-        # Expand matte to 3 channels
-        matte_3ch = np.stack([matte_resized] * 3, axis=-1)
+        Returns whatever write_frame() takes: packed YUYV from the fused blends, a BGR frame
+        (trails, or no Numba), or a BGR GpuMat from the OpenCV CUDA composite.
+        """
+        if self.gpu_composite:
+            return self.composite_gpu(frame, matte)
+
+        # Resize frame to output size (skipped when capture and output sizes match)
+        if frame.shape[:2] != (self.output_height, self.output_width):
+            frame_resized = cv2.resize(frame, (self.output_width, self.output_height), dst=self._resized_buf)
+        else:
+            frame_resized = frame
+        # Single upsample of the model-resolution matte straight to output size
+        matte_resized = cv2.resize(matte, (self.output_width, self.output_height), dst=self._matte_resized_buf,
+                                   interpolation=cv2.INTER_LINEAR)
 
         # Apply foreground effect if specified
         if self.foreground_effect:
@@ -376,19 +1183,8 @@ class CamolaGPU:
             # Generate plasma effect background
             background = self.generate_plasma()
         elif self.pixelate_background:
-            # Create pixelated version of the frame
-            h, w = frame_resized.shape[:2]
-            # Downscale to pixelate
-            small = cv2.resize(frame_resized, (w // self.pixel_size, h // self.pixel_size),
-                             interpolation=cv2.INTER_LINEAR)
-            # Upscale back using nearest neighbor to keep blocky pixels
-            pixelated = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
-
-            # Apply color inversion if requested
-            if self.invert_background:
-                pixelated = 255 - pixelated
-
-            background = pixelated
+            # Create pixelated (optionally inverted) version of the frame
+            background = self.pixelate(frame_resized, self._pix_small, self._pix_up, self.invert_background)
         else:
             # Get background (static or video frame)
             background = self.get_background_frame()
@@ -402,150 +1198,323 @@ class CamolaGPU:
             # Capture trail snapshot at intervals
             if self.frame_counter % self.trails_interval == 0:
                 # Capture foreground with effects
-                trail_foreground = foreground.copy()
+                trail_foreground = foreground
 
                 # Apply pixelation to trail if enabled
                 if self.trails_pixelate:
-                    h, w = trail_foreground.shape[:2]
-                    small = cv2.resize(trail_foreground, (w // self.pixel_size, h // self.pixel_size),
-                                     interpolation=cv2.INTER_LINEAR)
-                    trail_foreground = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+                    trail_foreground = self.pixelate(trail_foreground, self._trail_pix_small, self._trail_pix_up)
 
-                # Store foreground with alpha (RGBA premultiplied)
-                trail_frame = (trail_foreground * matte_3ch).astype(np.uint8)
-                trail_matte = matte_resized.copy()
-                self.trails_buffer.append((trail_frame, trail_matte))
+                # Store foreground with alpha (RGBA premultiplied) in the next ring slot,
+                # overwriting the oldest snapshot once the ring is full
+                slot = self._trail_next
+                np.multiply(trail_foreground, matte_resized[..., None], out=self._trail_frames[slot], casting='unsafe')
+                np.copyto(self._trail_mattes[slot], matte_resized)
+                self._trail_next = (slot + 1) % self.trails_count
+                self._trail_filled = min(self._trail_filled + 1, self.trails_count)
 
             # Composite trails onto background
-            if len(self.trails_buffer) > 0:
+            if self._trail_filled > 0 and HAS_NUMBA:
+                # Trails and the current frame in a single fused pass (no per-trail intermediates)
+                num_trails = self._trail_filled
+                slots = (np.arange(num_trails) + self._trail_next - num_trails) % self.trails_count
+                opacities = np.linspace(self.trails_fade_start, self.trails_fade_end, num_trails, dtype=np.float32)
+                composite_trails(foreground, matte_resized, np.float32(self.foreground_opacity),
+                                 self._trail_frames, self._trail_mattes, slots, opacities,
+                                 self._hue_mats, background, self._out_buf)
+                composited = self._out_buf
+            elif self._trail_filled > 0:
                 # Start with background
-                result = background.copy()
+                result = self._trail_result
+                np.copyto(result, background)
 
                 # Layer trails from oldest to newest with increasing opacity
-                num_trails = len(self.trails_buffer)
-                for i, (trail_frame, trail_matte) in enumerate(self.trails_buffer):
+                num_trails = self._trail_filled
+                oldest = self._trail_next - num_trails
+                for i in range(num_trails):
+                    slot = (oldest + i) % self.trails_count
+                    trail_frame = self._trail_frames[slot]
+                    trail_matte = self._trail_mattes[slot]
+
                     # Calculate opacity using exponential decay
                     # Oldest trail = fade_start, newest trail = fade_end
                     t = i / max(num_trails - 1, 1)  # 0.0 to 1.0
                     opacity = self.trails_fade_start + t * (self.trails_fade_end - self.trails_fade_start)
 
                     # Apply hue shift if enabled
-                    trail_display = trail_frame.copy()
+                    trail_display = trail_frame
                     if self.trails_hue_shift != 0:
-                        # Convert to HSV, shift hue, convert back
-                        hsv = cv2.cvtColor(trail_display, cv2.COLOR_BGR2HSV).astype(np.float32)
-                        hue_shift = self.trails_hue_shift * i  # Progressive shift
-                        hsv[:, :, 0] = (hsv[:, :, 0] + hue_shift) % 180
-                        trail_display = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+                        # Progressive shift as a single colour-matrix pass
+                        trail_display = cv2.transform(trail_frame, self._hue_mats[i])
 
-                    # Expand matte to 3 channels and apply opacity
-                    trail_matte_3ch = np.stack([trail_matte] * 3, axis=-1) * opacity
-
-                    # Composite this trail onto result
-                    result = (trail_display * trail_matte_3ch + result * (1 - trail_matte_3ch)).astype(np.uint8)
+                    # Composite this trail onto result with its opacity, in place
+                    result = self.blend(trail_display, result, trail_matte, opacity, out=result)
 
                 # Composite current frame on top with global opacity (sharp, not pixelated)
-                final_matte = matte_3ch * self.foreground_opacity
-                composited = (foreground * final_matte + result * (1 - final_matte)).astype(np.uint8)
+                composited = self.blend(foreground, result, matte_resized, self.foreground_opacity)
             else:
                 # No trails in buffer yet, just composite foreground + background
-                final_matte = matte_3ch * self.foreground_opacity
-                composited = (foreground * final_matte + background * (1 - final_matte)).astype(np.uint8)
+                composited = self.blend_yuyv(foreground, background, matte_resized, self.foreground_opacity)
         else:
             # No trails, just composite foreground + background
-            final_matte = matte_3ch * self.foreground_opacity
-            composited = (foreground * final_matte + background * (1 - final_matte)).astype(np.uint8)
+            composited = self.blend_yuyv(foreground, background, matte_resized, self.foreground_opacity)
 
         return composited
 
+    def write_frame_gpu(self, gpu_frame):
+        """Pack a BGR GpuMat to YUYV on the GPU and write it to the v4l2loopback device"""
+        stream = self._out_stream
+        if gpu_frame.size() != (self.output_width, self.output_height):
+            cv2.cuda.resize(gpu_frame, (self.output_width, self.output_height), dst=self._gpu_out, stream=stream)
+            gpu_frame = self._gpu_out
+
+        # CUDA cvtColor has no packed 4:2:2 output, so build it from full-range YCrCb:
+        # rescale to limited-range BT.601 (matching COLOR_BGR2YUV_YUY2), halve chroma horizontally,
+        # interleave Cb/Cr, then interleave that with Y
+        cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGR2YCrCb, dst=self._gpu_ycrcb, stream=stream)
+        y, cr, cb = self._gpu_ycrcb_planes
+        cv2.cuda.split(self._gpu_ycrcb, self._gpu_ycrcb_planes, stream=stream)
+        y.convertTo(cv2.CV_8UC1, 219.0 / 255.0, 16.0, stream, y)
+        u_half, v_half = self._gpu_chroma_half
+        for full, half in ((cb, u_half), (cr, v_half)):
+            cv2.cuda.resize(full, (self.output_width // 2, self.output_height), dst=half,
+                            interpolation=cv2.INTER_AREA, stream=stream)
+            half.convertTo(cv2.CV_8UC1, 224.0 / 255.0, 128.0 * 31.0 / 255.0, stream, half)
+        cv2.cuda.merge(self._gpu_chroma_half, self._gpu_uv, stream=stream)
+        cv2.cuda.merge([y, self._gpu_uv.reshape(1)], self._gpu_yuyv, stream=stream)
+
+        frame_yuyv = self._next_yuyv_buf()
+        self._gpu_yuyv.download(stream, frame_yuyv)
+        stream.waitForCompletion()
+        self._submit_yuyv(frame_yuyv)
+
+    def _next_yuyv_buf(self):
+        """Return the next YUYV output buffer in rotation"""
+        buf = self._yuyv_bufs[self._yuyv_index]
+        self._yuyv_index = (self._yuyv_index + 1) % len(self._yuyv_bufs)
+        return buf
+
+    def _submit_yuyv(self, frame_yuyv):
+        """Queue a packed frame for the writer thread, or write it directly outside the pipeline"""
+        if self.write_queue is None:
+            # Write to device straight from the array's buffer (no intermediate bytes copy)
+            os.write(self.out_fd, frame_yuyv.data)
+        else:
+            # Blocking put (not drop-stale): the writer then holds at most one buffer and the queue
+            # two, so the rotation never refills a buffer that is still queued or being written
+            while not self.stop_event.is_set():
+                try:
+                    self.write_queue.put(frame_yuyv, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
     def write_frame(self, frame):
-        """Write frame to v4l2loopback device"""
+        """Write frame (BGR or packed YUYV host array, or BGR GpuMat) to v4l2loopback device"""
+        if HAS_CV2_CUDA and isinstance(frame, cv2.cuda_GpuMat):
+            self.write_frame_gpu(frame)
+            return
+        if frame.ndim == 3 and frame.shape[2] == 2:
+            # Already packed YUYV (fused composite)
+            self._submit_yuyv(frame)
+            return
+
         # Ensure correct size
         if frame.shape[:2] != (self.output_height, self.output_width):
             frame = cv2.resize(frame, (self.output_width, self.output_height))
 
         # Convert BGR to YUYV (YUV 4:2:2 packed) format for browser compatibility
-        frame_yuyv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_YUY2)
+        frame_yuyv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_YUY2, dst=self._next_yuyv_buf())
+
+        self._submit_yuyv(frame_yuyv)
+
+    @staticmethod
+    def _put_latest(q, item):
+        """Put item on a bounded queue, discarding stale entries if it is full"""
+        while True:
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _record_stage(self, stage, elapsed, frames=1):
+        """Accumulate per-stage timing (over frames frames) for the periodic stats log"""
+        totals = self.stage_times[stage]
+        totals[0] += elapsed
+        totals[1] += frames
+
+    def _run_stage(self, worker):
+        """Run a pipeline stage; when any stage exits, signal the others to stop"""
+        try:
+            worker()
+        finally:
+            self.stop_event.set()
 
-        # Write to device
-        self.output_device.write(frame_yuyv.tobytes())
-        self.output_device.flush()
+    def _capture_worker(self):
+        """Capture stage: read webcam frames and pass on only the latest"""
+        while not self.stop_event.is_set():
+            capture_start = time.time()
+            ret, frame = self.cap.read()
+            if not ret:
+                print("Failed to capture frame")
+                break
+            self._record_stage('capture', time.time() - capture_start)
+            self._put_latest(self.frame_queue, frame)
+
+    def _background_worker(self):
+        """Background stage: keep the next background video frame decoded and ready"""
+        while not self.stop_event.is_set():
+            bg_frame = self.read_background_frame()
+            # Blocking put: the video advances one frame per composited frame, not at decode speed
+            while not self.stop_event.is_set():
+                try:
+                    self.background_queue.put(bg_frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _segment_worker(self):
+        """Inference stage: segment the latest frame(s) and pass on (frame, matte) pairs"""
+        while not self.stop_event.is_set():
+            try:
+                frames = [self.frame_queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            # Gather a batch, waiting at most about one frame period for each further frame
+            while len(frames) < self.batch_size:
+                try:
+                    frames.append(self.frame_queue.get(timeout=self.frame_duration))
+                except queue.Empty:
+                    break
+
+            segment_start = time.time()
+            mattes = self.segment_batch(frames)
+            self._record_stage('segment', time.time() - segment_start, len(frames))
+            for frame, matte in zip(frames, mattes):
+                self._put_latest(self.matte_queue, (frame, matte))
+
+    def _wait_until(self, deadline_ns):
+        """Block until the CLOCK_MONOTONIC time deadline_ns"""
+        if self._pacing_timer is not None:
+            # Absolute-deadline timer: no relative-sleep rounding, and wakeups don't drift
+            os.timerfd_settime_ns(self._pacing_timer, flags=os.TFD_TIMER_ABSTIME, initial=deadline_ns)
+            os.read(self._pacing_timer, 8)
+        else:
+            remaining = deadline_ns - time.monotonic_ns()
+            if remaining > 0:
+                time.sleep(remaining / 1e9)
+
+    def _composite_worker(self):
+        """Output stage: composite, write to the loopback device and pace to the target fps"""
+        frame_count = 0
+        pipeline_start = time.time()
+        frame_ns = round(1e9 / self.target_fps)
+        next_deadline = time.monotonic_ns() + frame_ns
+
+        while not self.stop_event.is_set():
+            try:
+                frame, matte = self.matte_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Compositing
+            composite_start = time.time()
+            output_frame = self.composite(frame, matte)
+            self._record_stage('composite', time.time() - composite_start)
+
+            # Output
+            output_start = time.time()
+            self.write_frame(output_frame)
+            self._record_stage('output', time.time() - output_start)
+
+            frame_count += 1
+            self.frame_counter += 1
+
+            # Update plasma time for animation
+            if self.plasma_enabled:
+                self.plasma_time += self.plasma_speed * self.frame_duration
+
+            # Log stats every 30 frames
+            if frame_count % 30 == 0:
+                avg_ms = {stage: (total / count) * 1000 if count else 0.0
+                          for stage, (total, count) in self.stage_times.items()}
+                total_ms = sum(avg_ms.values())
+                actual_fps = frame_count / (time.time() - pipeline_start)
+
+                print(f"Frame {frame_count}: capture={avg_ms['capture']:.1f}ms, "
+                      f"segment={avg_ms['segment']:.1f}ms, composite={avg_ms['composite']:.1f}ms, "
+                      f"output={avg_ms['output']:.1f}ms, latency={total_ms:.1f}ms, fps={actual_fps:.1f}")
+
+            # Frame rate limiting against an absolute monotonic schedule, so jitter doesn't accumulate
+            remaining = next_deadline - time.monotonic_ns()
+            if remaining > 0:
+                self._wait_until(next_deadline)
+            if remaining < -frame_ns:
+                # More than a frame behind: resync rather than bursting to catch up
+                next_deadline = time.monotonic_ns() + frame_ns
+            else:
+                next_deadline += frame_ns
+
+    def _write_worker(self):
+        """Write stage: hand packed frames to the loopback device, off the composite thread"""
+        while not self.stop_event.is_set():
+            try:
+                frame_yuyv = self.write_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            os.write(self.out_fd, frame_yuyv.data)
 
     def run(self):
-        """Main processing loop"""
+        """Main processing loop: capture, segmentation, compositing and writing run as overlapping threads"""
         print("Starting main pipeline loop")
         print(f"Segmentation enabled, background={'yes' if self.background is not None else 'no'}")
         print("Press Ctrl+C to stop")
 
-        frame_count = 0
-        total_capture_time = 0.0
-        total_segment_time = 0.0
-        total_composite_time = 0.0
-        total_output_time = 0.0
+        # Queues between stages hold one batch at most, so each stage works on the freshest data
+        self.frame_queue = queue.Queue(maxsize=self.batch_size)
+        self.matte_queue = queue.Queue(maxsize=self.batch_size)
+        if self.background_video_cap is not None:
+            self.background_queue = queue.Queue(maxsize=1)
+        self.write_queue = queue.Queue(maxsize=2)
+        self.stage_times = {stage: [0.0, 0] for stage in ('capture', 'segment', 'composite', 'output')}
+        self.stop_event = threading.Event()
+        # timerfd pacing needs Python 3.13+; otherwise pacing falls back to time.sleep
+        self._pacing_timer = os.timerfd_create(time.CLOCK_MONOTONIC) if hasattr(os, 'timerfd_create') else None
+
+        workers = [threading.Thread(target=self._run_stage, args=(worker,), name=name, daemon=True)
+                   for name, worker in (('capture', self._capture_worker),
+                                        ('segment', self._segment_worker),
+                                        ('composite', self._composite_worker),
+                                        ('write', self._write_worker))]
+        if self.background_queue is not None:
+            workers.append(threading.Thread(target=self._run_stage, args=(self._background_worker,),
+                                            name='background', daemon=True))
 
         try:
-            while True:
-                loop_start = time.time()
-
-                # Capture frame
-                capture_start = time.time()
-                ret, frame = self.cap.read()
-                if not ret:
-                    print("Failed to capture frame")
-                    break
-                capture_time = time.time() - capture_start
-                total_capture_time += capture_time
-
-                # Segmentation
-                segment_start = time.time()
-                matte = self.segment(frame)
-                segment_time = time.time() - segment_start
-                total_segment_time += segment_time
-
-                # Compositing
-                composite_start = time.time()
-                output_frame = self.composite(frame, matte)
-                composite_time = time.time() - composite_start
-                total_composite_time += composite_time
-
-                # Output
-                output_start = time.time()
-                self.write_frame(output_frame)
-                output_time = time.time() - output_start
-                total_output_time += output_time
-
-                frame_count += 1
-                self.frame_counter += 1
-
-                # Update plasma time for animation
-                if self.plasma_enabled:
-                    self.plasma_time += self.plasma_speed * self.frame_duration
-
-                # Log stats every 30 frames
-                if frame_count % 30 == 0:
-                    avg_capture_ms = (total_capture_time / frame_count) * 1000
-                    avg_segment_ms = (total_segment_time / frame_count) * 1000
-                    avg_composite_ms = (total_composite_time / frame_count) * 1000
-                    avg_output_ms = (total_output_time / frame_count) * 1000
-                    total_ms = avg_capture_ms + avg_segment_ms + avg_composite_ms + avg_output_ms
-                    actual_fps = 1000.0 / total_ms
-
-                    print(f"Frame {frame_count}: capture={avg_capture_ms:.1f}ms, "
-                          f"segment={avg_segment_ms:.1f}ms, composite={avg_composite_ms:.1f}ms, "
-                          f"output={avg_output_ms:.1f}ms, total={total_ms:.1f}ms, fps={actual_fps:.1f}")
-
-                # Frame rate limiting
-                elapsed = time.time() - loop_start
-                if elapsed < self.frame_duration:
-                    time.sleep(self.frame_duration - elapsed)
+            for worker in workers:
+                worker.start()
+            while not self.stop_event.wait(0.5):
+                pass
 
         except KeyboardInterrupt:
             print("\nStopping...")
         finally:
+            self.stop_event.set()
+            for worker in workers:
+                if worker.is_alive():
+                    worker.join()
+            self.background_queue = None
+            self.write_queue = None
             self.cap.release()
             if self.background_video_cap is not None:
                 self.background_video_cap.release()
-            self.output_device.close()
+            if self._pacing_timer is not None:
+                os.close(self._pacing_timer)
+            os.close(self.out_fd)
             print("Camola stopped")
 
 def main():
@@ -578,8 +1547,14 @@ def main():
     parser.add_argument("--plasma-palette", choices=['classic', 'fire', 'ocean', 'neon', 'monochrome'], default='classic', help="Plasma color palette (default: classic)")
     parser.add_argument("--foreground-opacity", type=float, default=1.0, help="Foreground (you) opacity, 0.0-1.0 (default: 1.0, fully opaque)")
     parser.add_argument("--foreground-saturation", type=float, default=1.0, help="Foreground (you) color saturation multiplier (default: 1.0)")
+    parser.add_argument("--trt-cache", default="./trt_cache", help="Directory for cached TensorRT engines (default: ./trt_cache)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per inference call; >1 trades latency for throughput and needs a dynamic-batch model (default: 1)")
+    parser.add_argument("--static-threshold", type=int, default=2, help="Reuse the last matte when the frame changed by at most this much, -1 to always segment (default: 2)")
+    parser.add_argument("--precision", choices=['fp32', 'fp16', 'int8'], default='fp16', help="Inference precision on the GPU; int8 needs TensorRT and quantizes the model using webcam calibration frames on first run (default: fp16)")
 
     args = parser.parse_args()
+    if args.output_width % 2:
+        parser.error("--output-width must be even (YUYV packs pixel pairs)")
 
     camola = CamolaGPU(
         model_path=args.model,
@@ -609,6 +1584,10 @@ def main():
         plasma_palette=args.plasma_palette,
         foreground_opacity=args.foreground_opacity,
         foreground_saturation=args.foreground_saturation,
+        trt_cache_path=args.trt_cache,
+        static_threshold=args.static_threshold,
+        batch_size=args.batch_size,
+        precision=args.precision,
         fps=args.fps
     )
 
@@ -72,6 +72,14 @@ CAMERA OPTIONS:
 
 MODEL OPTIONS:
     --model PATH                       ONNX model path (required)
+    --trt-cache DIR                    TensorRT engine cache directory (default: ./trt_cache)
+    --static-threshold N               Reuse the last matte when the frame changed
+                                       by at most N levels, -1 to always segment (default: 2)
+    --batch-size N                     Frames per inference call; >1 adds latency and
+                                       needs a dynamic-batch model (default: 1)
+    --precision PRECISION              Inference precision: fp32, fp16, int8 (default: fp16).
+                                       int8 needs TensorRT on the GPU and captures 200 webcam
+                                       calibration frames on first run to quantize the model
 
 EXAMPLES:
     # Default plasma effect with transparency and saturation